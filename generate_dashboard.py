@@ -1,217 +1,439 @@
 # generate_dashboard.py
 #!/usr/bin/env python3
 import pandas as pd
-import matplotlib.pyplot as plt
+import pyarrow as pa
+import pyarrow.csv as pv
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import os
+import json
 import numpy as np
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # ─── CONFIG ────────────────────────────────────────────────────────────────
-HIST_FILE = "historical_listings.csv"
-OUT_DIR   = "docs"
-REPORT    = os.path.join(OUT_DIR, "index.html")
+HIST_FILE  = "historical_listings.csv"
+CACHE_FILE = "historical_listings.parquet"   # cleaned rows from previous runs
+CACHE_META = CACHE_FILE + ".json"            # HIST_FILE size/mtime the cache matches
+OUT_DIR    = "docs"
+REPORT     = os.path.join(OUT_DIR, "index.html")
+CHART_DPI  = 80
+CURRENT_YEAR = datetime.now().year
+YEAR_RANGE   = (0, np.iinfo('int16').max)   # years outside would wrap int16 year/age
 # ───────────────────────────────────────────────────────────────────────────
 
-# Ensure output directory exists
-os.makedirs(OUT_DIR, exist_ok=True)
+# ─── LOADING ───────────────────────────────────────────────────────────────
+CATEGORY_COLUMNS = ("price_currency", "fuel", "model", "municipality")
+
+NUMERIC_COLUMNS  = ("year", "price_value")
+
+def read_history():
+    """Parse HIST_FILE with Arrow's multi-threaded CSV reader.
+
+    year and price_value are read as float32 (nullable, and tolerant of the
+    "2022.0" the merge step writes). If a stray non-numeric cell makes Arrow
+    reject that, the file is re-read with those columns as text and coerced
+    with pd.to_numeric(errors='coerce'), so bad rows are dropped in clean()
+    instead of failing the run.
+    """
+    read_opts = pv.ReadOptions(block_size=64 << 20, use_threads=True)
+    category  = pa.dictionary(pa.int32(), pa.string())
+
+    def read(numeric_type):
+        convert_opts = pv.ConvertOptions(
+            column_types={
+                **{c: numeric_type for c in NUMERIC_COLUMNS},
+                "scrape_date": pa.timestamp("ns"),
+                "mileage":     category,      # "100 000 - 125 000 km" ranges
+                **{c: category for c in CATEGORY_COLUMNS},
+            },
+            strings_can_be_null=True,
+        )
+        table = pv.read_csv(HIST_FILE, read_options=read_opts, convert_options=convert_opts)
+        return table.to_pandas(self_destruct=True)
 
-# Load raw data
-df = pd.read_csv(HIST_FILE, parse_dates=["scrape_date"])
-
-# Filter only Euro prices
-df = df[df['price_currency'].str.upper() == 'EUR']
-
-# Parse numeric year and price
-df["year"]  = pd.to_numeric(df["year"], errors="coerce").astype('Int64')
-df["price"] = pd.to_numeric(df["price_value"], errors="coerce")
-
-# Parse mileage ranges: take lower bound
-def parse_mileage(m):
     try:
-        m = str(m)
-        low = m.split('-')[0] if '-' in m else m
-        return int(low.replace(' ', ''))
-    except:
-        return pd.NA
-
-df['mileage'] = df['mileage'].apply(parse_mileage).astype('Int64')
-
-# Drop rows missing core numeric fields
-df = df.dropna(subset=["year", "price", "mileage"]).copy()
-
-# Filter out unrealistic price outliers using IQR
-Q1 = df['price'].quantile(0.25)
-Q3 = df['price'].quantile(0.75)
-IQR = Q3 - Q1
-lower_bound = max(Q1 - 1.5 * IQR, 0)
-upper_bound = Q3 + 1.5 * IQR
-df = df[(df['price'] >= lower_bound) & (df['price'] <= upper_bound)].copy()
-
-# Derive age
-df["age"] = datetime.now().year - df["year"].astype(int)
-
-# ─── SUMMARY METRICS ────────────────────────────────────────────────────────
-total_listings  = len(df)
-avg_price       = df['price'].mean()
-avg_mileage     = df['mileage'].mean()
-avg_age         = df['age'].mean()
-
-# Price by fuel type
-type_counts    = df['fuel'].value_counts()
-avg_price_fuel = df.groupby('fuel')['price'].mean()
-
-# Top models by count
-top_models         = df['model'].value_counts().head(20)
-models_for_heatmap = top_models.index
-
-# Region mapping
-def map_region(m):
-    m = str(m).lower()
-    if 'tir' in m:
-        return 'Tirane'
-    if 'dur' in m:
-        return 'Durres'
-    if 'vl' in m:
-        return 'Vlore'
-    return 'Other'
-
-df['region']        = df['municipality'].apply(map_region)
-avg_price_region   = df.groupby('region')['price'].mean()
-count_region       = df['region'].value_counts()
-
-# Time series
-daily_counts      = df.set_index('scrape_date').resample('D')['listing_url'].count()
-daily_avg_price   = df.set_index('scrape_date').resample('D')['price'].mean()
-monthly_counts    = df.set_index('scrape_date').resample('M')['listing_url'].count()
-monthly_avg_price = df.set_index('scrape_date').resample('M')['price'].mean()
-
-# Top municipalities
-top_munis = df.groupby('municipality')['price'].mean().sort_values(ascending=False).head(10)
-
-# ─── PERCENTAGES ─────────────────────────────────────────────────────────────
-model_pct   = top_models     / total_listings * 100
-fuel_pct    = type_counts    / total_listings * 100
-region_pct  = count_region   / total_listings * 100
-daily_pct   = daily_counts   / total_listings * 100
-monthly_pct = monthly_counts / total_listings * 100
-
-# ─── EXPORT DATA ───────────────────────────────────────────────────────────
-df.to_csv(os.path.join(OUT_DIR, 'historical_listings.csv'), index=False)
-top_models.to_csv(os.path.join(OUT_DIR, 'top_models.csv'), header=['count'])
-avg_price_fuel.to_csv(os.path.join(OUT_DIR, 'avg_price_by_fuel.csv'), header=['avg_price'])
-avg_price_region.to_csv(os.path.join(OUT_DIR, 'avg_price_by_region.csv'), header=['avg_price'])
-count_region.to_csv(os.path.join(OUT_DIR, 'count_by_region.csv'), header=['count'])
-daily_counts.to_csv(os.path.join(OUT_DIR, 'daily_volume.csv'), header=['count'])
-daily_avg_price.to_csv(os.path.join(OUT_DIR, 'daily_avg_price.csv'), header=['avg_price'])
-monthly_counts.to_csv(os.path.join(OUT_DIR, 'monthly_volume.csv'), header=['count'])
-monthly_avg_price.to_csv(os.path.join(OUT_DIR, 'monthly_avg_price.csv'), header=['avg_price'])
-top_munis.to_csv(os.path.join(OUT_DIR, 'top_municipalities.csv'), header=['avg_price'])
-
-# ─── EXPORT PERCENTAGE DATA ─────────────────────────────────────────────────
-model_pct.to_csv(os.path.join(OUT_DIR, 'top_models_pct.csv'), header=['percent'])
-fuel_pct.to_csv(os.path.join(OUT_DIR, 'fuel_distribution_pct.csv'), header=['percent'])
-region_pct.to_csv(os.path.join(OUT_DIR, 'count_by_region_pct.csv'), header=['percent'])
-daily_pct.to_csv(os.path.join(OUT_DIR, 'daily_volume_pct.csv'), header=['percent'])
-monthly_pct.to_csv(os.path.join(OUT_DIR, 'monthly_volume_pct.csv'), header=['percent'])
+        return read(pa.float32())
+    except pa.ArrowInvalid:
+        df = read(pa.string())
+        for c in NUMERIC_COLUMNS:
+            df[c] = pd.to_numeric(df[c], errors='coerce').astype('float32')
+        return df
+
+def clean(df):
+    """EUR listings with parsed year/price/mileage, narrowed dtypes."""
+    # Keep Euro prices with all raw core fields present before parsing
+    # anything; upper-case the few currency categories, not every row
+    currencies = df['price_currency'].cat.categories
+    keep = (df['price_currency'].isin(currencies[currencies.str.upper() == 'EUR'])
+            & df[['year', 'price_value', 'mileage']].notna().all(axis=1))
+    df = df[keep]
+
+    # Parse mileage ranges: take lower bound. The site offers a short fixed
+    # list of ranges, so parse each distinct label once and spread the
+    # results by category code (the trailing NaN is what code -1 picks up)
+    ranges = df['mileage'].cat.categories
+    lower  = pd.to_numeric(
+        ranges.str.split('-', n=1).str[0].str.replace(' ', '', regex=False),
+        errors='coerce'
+    )
+    mileage = np.append(lower.to_numpy(dtype='float64'), np.nan)[df['mileage'].cat.codes]
+
+    # One chain, one materialised frame: year and price arrive numeric from
+    # the reader; ranges that did not parse and years/mileages that would
+    # wrap when narrowed are dropped (real classic-car years are kept);
+    # dtypes are narrowed to halve the bytes every aggregation streams through
+    return (
+        df.assign(price=df['price_value'], mileage=mileage)
+          .loc[lambda d: d['year'].between(*YEAR_RANGE)
+                         & d['mileage'].between(0, np.iinfo('int32').max)]
+          .astype({'year': 'int16', 'mileage': 'int32', 'price': 'float32'})
+    )
+
+def load_listings():
+    """Cleaned listings, reusing CACHE_FILE as far as HIST_FILE allows.
+
+    Unchanged CSV (same size and mtime as recorded in CACHE_META): the
+    cache is returned without touching the CSV. Grown CSV: only rows newer
+    than the cache are cleaned and appended. Otherwise: full rebuild.
+    """
+    st    = os.stat(HIST_FILE)
+    stamp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    meta  = None
+    if os.path.exists(CACHE_FILE) and os.path.exists(CACHE_META):
+        with open(CACHE_META, encoding="utf-8") as f:
+            meta = json.load(f)
+    if meta == stamp:
+        return pd.read_parquet(CACHE_FILE)
+
+    raw = read_history()
+    if meta is not None and meta["size"] <= stamp["size"]:
+        cached = pd.read_parquet(CACHE_FILE)
+        new    = clean(raw[raw['scrape_date'] > cached['scrape_date'].max()])
+        # Same categories on both sides so concat keeps the categorical dtype
+        for c in CATEGORY_COLUMNS:
+            cats      = cached[c].cat.categories.union(new[c].cat.categories)
+            cached[c] = cached[c].cat.set_categories(cats)
+            new[c]    = new[c].cat.set_categories(cats)
+        df = pd.concat([cached, new], ignore_index=True)
+    else:
+        df = clean(raw)
+    df.to_parquet(CACHE_FILE, compression='zstd', index=False)
+    with open(CACHE_META, "w", encoding="utf-8") as f:
+        json.dump(stamp, f)
+    return df
+
+# ─── EXPORT HELPERS ────────────────────────────────────────────────────────
+CSV_UNQUOTED = pv.WriteOptions(quoting_style="none", quoting_header="none")
+
+def fast_to_csv(obj, path, header=None, index=True):
+    """Write a Series/DataFrame through Arrow's C++ CSV writer."""
+    if isinstance(obj, pd.Series):
+        obj = obj.to_frame(header[0] if header else obj.name)
+    resampled = isinstance(obj.index, pd.DatetimeIndex) and obj.index.freq is not None
+    if index:
+        obj = obj.reset_index()
+    table = pa.Table.from_pandas(obj, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_timestamp(field.type):
+            # bare dates for resampled indexes, scrape precision otherwise
+            target = pa.date32() if resampled and i == 0 else pa.timestamp('us')
+            table  = table.set_column(i, field.name, table.column(i).cast(target))
+    # Unquoted fields, like pandas' to_csv; values that do contain a comma,
+    # quote or newline can't be written that way, so such files keep Arrow's
+    # default quoting
+    try:
+        pv.write_csv(table, path, write_options=CSV_UNQUOTED)
+    except pa.ArrowInvalid:
+        pv.write_csv(table, path)
+
+# ─── AGGREGATION ───────────────────────────────────────────────────────────
+def group_stats(table, key):
+    """Mean price and listing count per non-null `key`, via Arrow's hash aggregate."""
+    stats = (
+        table.group_by(key, use_threads=True)
+             .aggregate([('price', 'mean'), ('price', 'count')])
+             .to_pandas()
+             .astype({key: object})   # plain labels, so sorting is alphabetical
+             .set_index(key)
+             .rename(columns={'price_mean': 'avg_price', 'price_count': 'count'})
+    )
+    # Threaded group_by emits groups in arrival order; sort by key like
+    # pandas groupby so exports and nlargest tie-breaks are deterministic
+    return stats[stats.index.notna()].sort_index()
 
 # ─── CHARTS ─────────────────────────────────────────────────────────────────
-# Heatmap: Avg price by model & year
-pivot = df[df['model'].isin(models_for_heatmap)].pivot_table(
-    index='model', columns='year', values='price', aggfunc='mean'
-).reindex(models_for_heatmap)
-plt.figure(figsize=(10,8))
-plt.imshow(pivot, aspect='auto', origin='lower', cmap='magma')
-plt.colorbar(label='Avg Price (EUR)')
-plt.yticks(range(len(pivot.index)), pivot.index)
-plt.xticks(range(len(pivot.columns)), pivot.columns, rotation=45)
-plt.title('Avg Price by Model & Year (Top 20 Models)')
-plt.tight_layout()
-plt.savefig(os.path.join(OUT_DIR, 'heatmap_model_year.png'))
-plt.close()
-
-# Depreciation curves for top 8 models
-plt.figure(figsize=(10,6))
-for model in top_models.head(8).index:
-    series = df[df['model'] == model].groupby('age')['price'].mean()
-    plt.plot(series.index, series.values, marker='o', label=model)
-plt.xlabel('Age (years)')
-plt.ylabel('Avg Price (EUR)')
-plt.title('Depreciation Curve – Top 8 Models')
-plt.legend(fontsize='small')
-plt.tight_layout()
-plt.savefig(os.path.join(OUT_DIR, 'depreciation_top8.png'))
-plt.close()
-
-# Historical avg price – Top 10 Models (monthly)
-model_monthly = (
-    df[df['model'].isin(top_models.index)]
-      .set_index('scrape_date')
-      .groupby([pd.Grouper(freq='M'), 'model'])['price']
-      .mean()
-      .unstack()
-      .reindex(columns=top_models.index)
-)
-
-plt.figure(figsize=(12,8))
-for m in top_models.index:
-    s = model_monthly[m]
-    plt.plot(s.index, s.values, marker='o', label=m)
-plt.xlabel('Date')
-plt.ylabel('Avg Price (EUR)')
-plt.title('Historical Avg Price – Top 10 Models')
-plt.legend(fontsize='small', ncol=2)
-plt.xlim(model_monthly.index.min(), model_monthly.index.max())
-plt.tight_layout()
-plt.savefig(os.path.join(OUT_DIR, 'historical_avg_price_top10.png'))
-plt.close()
-
-# Price by region bar chart
-plt.figure(figsize=(8,6))
-avg_price_region.plot(kind='bar')
-plt.ylabel('Avg Price (EUR)')
-plt.title('Avg Price by Region')
-plt.tight_layout()
-plt.savefig(os.path.join(OUT_DIR, 'regional_price.png'))
-plt.close()
-
-# Mileage distribution
-plt.figure(figsize=(8,4))
-df['mileage'].plot(kind='hist', bins=30)
-plt.xlabel('Mileage (km)')
-plt.title('Mileage Distribution')
-plt.tight_layout()
-plt.savefig(os.path.join(OUT_DIR, 'mileage_hist.png'))
-plt.close()
-
-# Fuel type distribution
-plt.figure(figsize=(6,4))
-type_counts.plot(kind='bar')
-plt.ylabel('Count')
-plt.title('Listings by Fuel Type')
-plt.tight_layout()
-plt.savefig(os.path.join(OUT_DIR, 'fuel_counts.png'))
-plt.close()
-
-# Monthly trends
-plt.figure(figsize=(8,4))
-monthly_counts.plot()
-plt.ylabel('Count')
-plt.title('Monthly Listing Volume')
-plt.tight_layout()
-plt.savefig(os.path.join(OUT_DIR, 'monthly_volume.png'))
-plt.close()
-
-plt.figure(figsize=(8,4))
-monthly_avg_price.plot()
-plt.ylabel('Avg Price (EUR)')
-plt.title('Monthly Avg Price')
-plt.tight_layout()
-plt.savefig(os.path.join(OUT_DIR, 'monthly_avg_price.png'))
-plt.close()
-
-# ─── BUILD HTML REPORT ───────────────────────────────────────────────────────
-now = datetime.now().strftime('%Y-%m-%d %H:%M')
-html = f'''<!doctype html>
+# One reusable Agg figure per size (per worker process); cleared between
+# charts instead of going through pyplot's figure registry for every chart.
+_figures = {}
+
+def new_axes(figsize):
+    fig = _figures.get(figsize)
+    if fig is None:
+        fig = _figures[figsize] = Figure(figsize=figsize, layout='constrained')
+        FigureCanvasAgg(fig)
+    fig.clear()
+    return fig, fig.add_subplot(111)
+
+def save(fig, path):
+    fig.savefig(path, dpi=CHART_DPI)
+
+def plot_heatmap(pivot, path):
+    """Avg price by model & year."""
+    fig, ax = new_axes((10,8))
+    im = ax.imshow(pivot, aspect='auto', origin='lower', cmap='magma')
+    fig.colorbar(im, ax=ax, label='Avg Price (EUR)')
+    ax.set_yticks(range(len(pivot.index)), pivot.index)
+    ax.set_xticks(range(len(pivot.columns)), pivot.columns, rotation=45)
+    ax.set_title('Avg Price by Model & Year (Top 20 Models)')
+    save(fig, path)
+
+def plot_depreciation(dep, path):
+    """Depreciation curves: avg price by age, one column per model."""
+    fig, ax = new_axes((10,6))
+    for model in dep.columns:
+        s = dep[model].dropna()
+        ax.plot(s.index, s.values, marker='o', label=model)
+    ax.set_xlabel('Age (years)')
+    ax.set_ylabel('Avg Price (EUR)')
+    ax.set_title('Depreciation Curve – Top 8 Models')
+    ax.legend(fontsize='small')
+    save(fig, path)
+
+def plot_model_history(model_monthly, path):
+    """Monthly avg price per model, one column per model."""
+    fig, ax = new_axes((12,8))
+    for m in model_monthly.columns:
+        s = model_monthly[m]
+        ax.plot(s.index, s.values, marker='o', label=m)
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Avg Price (EUR)')
+    ax.set_title('Historical Avg Price – Top 10 Models')
+    ax.legend(fontsize='small', ncol=2)
+    ax.set_xlim(model_monthly.index.min(), model_monthly.index.max())
+    save(fig, path)
+
+def plot_bar(series, figsize, ylabel, title, path):
+    fig, ax = new_axes(figsize)
+    series.plot(kind='bar', ax=ax)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    save(fig, path)
+
+def plot_hist(counts, edges, path):
+    """Mileage distribution from pre-binned counts."""
+    fig, ax = new_axes((8,4))
+    ax.hist(edges[:-1], edges, weights=counts)
+    ax.set_xlabel('Mileage (km)')
+    ax.set_ylabel('Frequency')
+    ax.set_title('Mileage Distribution')
+    save(fig, path)
+
+def plot_line(series, ylabel, title, path):
+    fig, ax = new_axes((8,4))
+    series.plot(ax=ax)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    save(fig, path)
+
+# ───────────────────────────────────────────────────────────────────────────
+
+def main():
+    # Ensure output directory exists
+    os.makedirs(OUT_DIR, exist_ok=True)
+
+    # Cleaned listings (incremental via the Parquet cache)
+    df = load_listings()
+    # Nothing to aggregate (no usable EUR rows): the quantiles, day range and
+    # percentages below are undefined, so keep the previous dashboard as is
+    if df.empty:
+        print(f"⚠️ No usable listings in {HIST_FILE}; dashboard not updated")
+        return
+
+    # Filter out unrealistic price outliers using IQR
+    prices = df['price'].to_numpy()
+    Q1, Q3 = np.quantile(prices, [0.25, 0.75])
+    IQR = Q3 - Q1
+    lower_bound = max(Q1 - 1.5 * IQR, 0)
+    upper_bound = Q3 + 1.5 * IQR
+    df = df.loc[(prices >= lower_bound) & (prices <= upper_bound)]
+
+    # Derived columns added in a single assign (one copy of the frame)
+    muni = df['municipality'].astype('string').str.lower()
+    df = df.assign(
+        # Drop categories emptied by the filters so value_counts/groupby only see real labels
+        **{c: df[c].cat.remove_unused_categories() for c in ('fuel', 'model', 'municipality')},
+        age=(CURRENT_YEAR - df['year']).astype('int16'),
+        region=pd.Categorical(np.select(
+            [muni.str.contains('tir', regex=False, na=False),
+             muni.str.contains('dur', regex=False, na=False),
+             muni.str.contains('vl',  regex=False, na=False)],
+            ['Tirane', 'Durres', 'Vlore'],
+            default='Other'
+        )),
+    )
+
+    # ─── SUMMARY METRICS ────────────────────────────────────────────────────────
+    total_listings  = len(df)
+    avg_price       = df['price'].mean()
+    avg_mileage     = df['mileage'].mean()
+    avg_age         = df['age'].mean()
+
+    # Per-category stats run on Arrow's multi-threaded hash aggregation
+    stats_tbl = pa.Table.from_pandas(
+        df[['fuel', 'model', 'region', 'municipality', 'price']], preserve_index=False
+    )
+
+    # Price by fuel type
+    fuel_stats     = group_stats(stats_tbl, 'fuel')
+    type_counts    = fuel_stats['count'].sort_values(ascending=False)
+    avg_price_fuel = fuel_stats['avg_price']
+
+    # Top models by count
+    top_models         = group_stats(stats_tbl, 'model')['count'].nlargest(20)
+    models_for_heatmap = top_models.index
+
+    # Top-model membership from the integer codes, computed once and shared
+    top_codes = df['model'].cat.categories.get_indexer(top_models.index)
+    top_mask  = np.isin(df['model'].cat.codes.to_numpy(), top_codes)
+    # Only the top models as categories, so the pivot/groupby key space is 20 codes
+    df_top    = df[top_mask].assign(
+        model=lambda d: d['model'].cat.set_categories(models_for_heatmap)
+    )
+
+    # Price and volume by region
+    region_stats       = group_stats(stats_tbl, 'region')
+    avg_price_region   = region_stats['avg_price']
+    count_region       = region_stats['count'].sort_values(ascending=False)
+
+    # Time series: daily counts and price sums from np.bincount on integer
+    # day codes, then wrapped in a daily DatetimeIndex like resample('D')
+    day   = df['scrape_date'].to_numpy().astype('datetime64[D]')
+    first = day.min()
+    idx   = (day - first).astype('int64')
+    n     = idx.max() + 1
+    # 'count' (non-null listing_url) is the exported volume; 'rows' counts
+    # every row and is the denominator for the mean, as resample().mean() was
+    daily = pd.DataFrame(
+        {'count':     np.bincount(idx, weights=df['listing_url'].notna().to_numpy(),
+                                  minlength=n).astype('int64'),
+         'rows':      np.bincount(idx, minlength=n),
+         'price_sum': np.bincount(idx, weights=df['price'].to_numpy(dtype='float64'),
+                                  minlength=n)},
+        index=pd.date_range(first, periods=n, freq='D',
+                            name='scrape_date'),
+    )
+    # Months roll up from the (tiny) daily frame instead of rescanning df
+    monthly = daily.resample('M').sum()
+    for frame in (daily, monthly):
+        frame['avg_price'] = frame['price_sum'] / frame['rows']
+    daily_counts      = daily['count']
+    daily_avg_price   = daily['avg_price']
+    monthly_counts    = monthly['count']
+    monthly_avg_price = monthly['avg_price']
+
+    # Top municipalities
+    top_munis = group_stats(stats_tbl, 'municipality')['avg_price'].nlargest(10)
+
+    # ─── PERCENTAGES ─────────────────────────────────────────────────────────────
+    # One multiply per series by a precomputed scale, not divide-then-multiply
+    pct_scale   = 100 / total_listings
+    model_pct   = top_models     * pct_scale
+    fuel_pct    = type_counts    * pct_scale
+    region_pct  = count_region   * pct_scale
+    daily_pct   = daily_counts   * pct_scale
+    monthly_pct = monthly_counts * pct_scale
+
+    # Plain-dict views for the per-row lookups in the HTML tables
+    model_pct_d         = model_pct.to_dict()
+    fuel_pct_d          = fuel_pct.to_dict()
+    region_pct_d        = region_pct.to_dict()
+    monthly_pct_d       = monthly_pct.to_dict()
+    avg_price_fuel_d    = avg_price_fuel.to_dict()
+    avg_price_region_d  = avg_price_region.to_dict()
+    monthly_avg_price_d = monthly_avg_price.to_dict()
+
+    # ─── EXPORT DATA ───────────────────────────────────────────────────────────
+    # Arrow's CSV writer releases the GIL, so the files go out on threads
+    exports = [
+        (df,                'historical_listings.csv', dict(index=False)),
+        (top_models,        'top_models.csv',          dict(header=['count'])),
+        (avg_price_fuel,    'avg_price_by_fuel.csv',   dict(header=['avg_price'])),
+        (avg_price_region,  'avg_price_by_region.csv', dict(header=['avg_price'])),
+        (count_region,      'count_by_region.csv',     dict(header=['count'])),
+        (daily_counts,      'daily_volume.csv',        dict(header=['count'])),
+        (daily_avg_price,   'daily_avg_price.csv',     dict(header=['avg_price'])),
+        (monthly_counts,    'monthly_volume.csv',      dict(header=['count'])),
+        (monthly_avg_price, 'monthly_avg_price.csv',   dict(header=['avg_price'])),
+        (top_munis,         'top_municipalities.csv',  dict(header=['avg_price'])),
+        # percentage data
+        (model_pct,         'top_models_pct.csv',          dict(header=['percent'])),
+        (fuel_pct,          'fuel_distribution_pct.csv',   dict(header=['percent'])),
+        (region_pct,        'count_by_region_pct.csv',     dict(header=['percent'])),
+        (daily_pct,         'daily_volume_pct.csv',        dict(header=['percent'])),
+        (monthly_pct,       'monthly_volume_pct.csv',      dict(header=['percent'])),
+    ]
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        futures = [ex.submit(fast_to_csv, obj, os.path.join(OUT_DIR, name), **kw)
+                   for obj, name, kw in exports]
+        for fut in futures:
+            fut.result()
+
+    # ─── CHARTS ─────────────────────────────────────────────────────────────────
+    pivot = df_top.pivot_table(
+        index='model', columns='year', values='price', aggfunc='mean', observed=True
+    ).reindex(models_for_heatmap)
+
+    top8 = top_models.head(8).index
+    dep = (
+        df_top[df_top['model'].isin(top8)]
+          .groupby(['model', 'age'], observed=True)['price']
+          .mean()
+          .unstack('model')
+          .reindex(columns=top8)
+    )
+
+    model_monthly = (
+        df_top.set_index('scrape_date')
+          .groupby([pd.Grouper(freq='M'), 'model'], observed=True)['price']
+          .mean()
+          .unstack()
+          .reindex(columns=top_models.index)
+    )
+
+    mileage_counts, mileage_edges = np.histogram(df['mileage'].to_numpy(dtype='int64'), bins=30)
+
+    # Each chart only needs a small aggregate, so render them in parallel
+    def chart(name):
+        return os.path.join(OUT_DIR, name)
+
+    jobs = [
+        (plot_heatmap,       pivot,         chart('heatmap_model_year.png')),
+        (plot_depreciation,  dep,           chart('depreciation_top8.png')),
+        (plot_model_history, model_monthly, chart('historical_avg_price_top10.png')),
+        (plot_bar,           avg_price_region, (8,6), 'Avg Price (EUR)', 'Avg Price by Region',
+                             chart('regional_price.png')),
+        (plot_hist,          mileage_counts, mileage_edges, chart('mileage_hist.png')),
+        (plot_bar,           type_counts,   (6,4), 'Count', 'Listings by Fuel Type',
+                             chart('fuel_counts.png')),
+        (plot_line,          monthly_counts, 'Count', 'Monthly Listing Volume',
+                             chart('monthly_volume.png')),
+        (plot_line,          monthly_avg_price, 'Avg Price (EUR)', 'Monthly Avg Price',
+                             chart('monthly_avg_price.png')),
+    ]
+    with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as ex:
+        futures = [ex.submit(fn, *args) for fn, *args in jobs]
+        for fut in futures:
+            fut.result()
+
+    # ─── BUILD HTML REPORT ───────────────────────────────────────────────────────
+    now = datetime.now().strftime('%Y-%m-%d %H:%M')
+    # Rows are written straight into the file rather than joined into one string
+    with open(REPORT, "w", encoding="utf-8") as f:
+        w = f.write
+        w(f'''<!doctype html>
 <html lang="en">
 <head>
   <meta charset="utf-8">
@@ -255,7 +477,10 @@ html = f'''<!doctype html>
       <img src="heatmap_model_year.png">
       <table>
         <tr><th>Model</th><th>Percentage</th></tr>
-        {''.join(f'<tr><td>{m}</td><td>{model_pct[m]:.1f}%</td></tr>' for m in model_pct.index)}
+        ''')
+        for m, pct in model_pct_d.items():
+            w(f'<tr><td>{m}</td><td>{pct:.1f}%</td></tr>')
+        w('''
       </table>
     </section>
 
@@ -275,7 +500,10 @@ html = f'''<!doctype html>
       <img src="regional_price.png">
       <table>
         <tr><th>Region</th><th>Avg Price</th><th>Percentage</th></tr>
-        {''.join(f'<tr><td>{r}</td><td>{avg_price_region[r]:,.0f}</td><td>{region_pct[r]:.1f}%</td></tr>' for r in region_pct.index)}
+        ''')
+        for r, pct in region_pct_d.items():
+            w(f'<tr><td>{r}</td><td>{avg_price_region_d[r]:,.0f}</td><td>{pct:.1f}%</td></tr>')
+        w('''
       </table>
     </section>
 
@@ -284,7 +512,10 @@ html = f'''<!doctype html>
       <img src="fuel_counts.png">
       <table>
         <tr><th>Fuel</th><th>Avg Price</th><th>Percentage</th></tr>
-        {''.join(f'<tr><td>{fuel}</td><td>{avg_price_fuel[fuel]:,.0f}</td><td>{fuel_pct[fuel]:.1f}%</td></tr>' for fuel in fuel_pct.index)}
+        ''')
+        for fuel, pct in fuel_pct_d.items():
+            w(f'<tr><td>{fuel}</td><td>{avg_price_fuel_d[fuel]:,.0f}</td><td>{pct:.1f}%</td></tr>')
+        w('''
       </table>
     </section>
 
@@ -299,7 +530,10 @@ html = f'''<!doctype html>
       <img src="monthly_avg_price.png">
       <table>
         <tr><th>Month</th><th>Percentage</th><th>Avg Price</th></tr>
-        {''.join(f"<tr><td>{idx.strftime('%Y-%m')}</td><td>{monthly_pct[idx]:.1f}%</td><td>{monthly_avg_price[idx]:,.0f}</td></tr>" for idx in monthly_pct.index[-6:])}
+        ''')
+        for idx in list(monthly_pct_d)[-6:]:
+            w(f"<tr><td>{idx.strftime('%Y-%m')}</td><td>{monthly_pct_d[idx]:.1f}%</td><td>{monthly_avg_price_d[idx]:,.0f}</td></tr>")
+        w('''
       </table>
     </section>
 
@@ -328,9 +562,9 @@ html = f'''<!doctype html>
 
   </div>
 </body>
-</html>'''
+</html>''')
 
-with open(REPORT, "w", encoding="utf-8") as f:
-    f.write(html)
+    print(f"✅ Dashboard updated: {REPORT}")
 
-print(f"✅ Dashboard updated: {REPORT}")
+if __name__ == "__main__":
+    main()
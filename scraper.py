@@ -1,132 +1,325 @@
-# scraper.py
 #!/usr/bin/env python3
+import asyncio
 import csv
+import html
+import json
+import logging
 import os
+import re
+import sqlite3
 import time
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from logging.handlers import MemoryHandler
 
-import requests
-from bs4 import BeautifulSoup
+import httpx
+from selectolax.lexbor import LexborHTMLParser
 from tqdm import tqdm
 
 # ─── CONFIG ────────────────────────────────────────────────────────────────
 BASE_URL           = "https://www.merrjep.al"
 LISTING_PATH       = "/njoftime/automjete/makina/ne-shitje"
 PAGES              = 200   # now scraping 60 pages
-CHUNK_SIZE         = 5
-MAX_DETAIL_WORKERS = 10
+MAX_CONCURRENCY    = 50    # requests in flight, multiplexed over HTTP/2
+MAX_RATE           = 20    # requests started per second (token bucket)
+MAX_RETRY_AFTER    = 60    # seconds; cap on a server-sent Retry-After
+PARSE_WORKERS      = os.cpu_count() or 1   # processes parsing listing HTML
 OUTPUT_FILE        = "today_listings.csv"
+WRITE_BUFFER       = 1 << 20   # bytes; rows hit disk in large blocks
+WRITE_QUEUE        = 16        # finished pages waiting for the writer
+HTTP_CACHE         = "http_cache.sqlite"   # validators + parsed fields per listing
+PARSER_VERSION     = 1     # bump when parse_listing_html changes; older cache rows are ignored
+SCRAPE_LOG         = "scrape.log"          # retries and failures, flushed in batches
 
 FIELDNAMES = [
     "scrape_date", "listing_url", "year", "transmission", "mileage",
     "fuel", "municipality", "color", "make", "model",
     "price_value", "price_currency"
 ]
+DETAIL_FIELDS = FIELDNAMES[2:]   # filled in from the listing page
 
 HEADERS = {
     "User-Agent": (
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
         "AppleWebKit/537.36 (KHTML, like Gecko) "
         "Chrome/115.0.0.0 Safari/537.36"
-    )
+    ),
+    # Brotli-compressed HTML is several times smaller on the wire;
+    # httpx decodes it transparently when the brotli package is installed
+    "Accept-Encoding": "gzip, br",
+}
+
+# first word of a .tag-item label → CSV field
+LABEL_MAP = {
+    "Viti":         "year",
+    "Transmetuesi": "transmission",
+    "Kilometrazha": "mileage",
+    "Karburanti":   "fuel",
+    "Komuna":       "municipality",
+    "Ngjyra":       "color",
+    "Prodhuesi":    "make",
+    "Modeli":       "model",
 }
 # ───────────────────────────────────────────────────────────────────────────
 
-def get_with_retries(session, url, retries=3, backoff=2):
+log = logging.getLogger("scraper")
+
+# Index pages only need the listing links, so they are pulled out of the raw
+# bytes: first each <a ...> tag carrying the Link_vis class, then its href
+# (in either attribute order); values may be double-, single- or unquoted
+LINK_TAG_RE = re.compile(
+    rb"""<a\s[^>]*(?<![\w-])class=(?:"[^"]*|'[^']*|)\bLink_vis(?![\w-])[^>]*>""", re.I)
+HREF_RE     = re.compile(
+    rb"""(?<![\w-])href=(?:"([^"]+)"|'([^']+)'|([^\s"'>]+))""", re.I)
+
+class Throttle:
+    """Caps requests in flight and the rate they start at.
+
+    `async with throttle:` takes a concurrency slot, then a token from a
+    bucket refilled at `rate` per second (bursts up to `rate`).
+    """
+
+    def __init__(self, max_concurrency, rate):
+        self.sem     = asyncio.Semaphore(max_concurrency)
+        self.lock    = asyncio.Lock()
+        self.rate    = rate
+        self.tokens  = rate
+        self.updated = time.monotonic()
+
+    async def __aenter__(self):
+        await self.sem.acquire()
+        try:
+            async with self.lock:
+                while True:
+                    now = time.monotonic()
+                    self.tokens  = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return self
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+        except BaseException:
+            self.sem.release()
+            raise
+
+    async def __aexit__(self, *exc):
+        self.sem.release()
+
+def retry_after(resp, default):
+    """Seconds to wait before retrying: the Retry-After header if usable."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return default
+    try:
+        wait = float(value)
+    except ValueError:
+        try:
+            wait = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return default
+    return min(max(wait, 0), MAX_RETRY_AFTER)
+
+def open_cache(path=HTTP_CACHE):
+    """Open (creating if needed) the conditional-GET cache of listing pages."""
+    db = sqlite3.connect(path)
+    columns = [row[1] for row in db.execute("PRAGMA table_info(listings)")]
+    if columns and "parser" not in columns:
+        # caches from before rows were versioned can't be trusted
+        db.execute("DROP TABLE listings")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS listings ("
+        " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, data TEXT,"
+        " parser INTEGER)"
+    )
+    return db
+
+async def get_with_retries(client, throttle, url, headers=None, retries=3, backoff=2):
     """GET with retries on HTTP errors and exponential back-off."""
     for attempt in range(1, retries + 1):
         try:
-            resp = session.get(url, timeout=10)
-            resp.raise_for_status()
+            async with throttle:
+                resp = await client.get(url, headers=headers)
+            if resp.status_code != 304:
+                resp.raise_for_status()
             return resp
-        except requests.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             if attempt < retries:
-                tqdm.write(f"[Retry {attempt}/{retries}] {url} → {e}; waiting {backoff}s")
-                time.sleep(backoff)
+                # 429/503 usually say how long to back off; trust that over our guess
+                wait = retry_after(e.response, backoff)
+                log.warning("[Retry %d/%d] %s → %s; waiting %gs", attempt, retries, url, e, wait)
+                await asyncio.sleep(wait)
                 backoff *= 2
             else:
                 raise
 
-def parse_detail(session, href):
-    """Fetch and parse a single listing’s details."""
-    url = href if href.startswith("http") else BASE_URL + href
-    resp = get_with_retries(session, url)
-    soup = BeautifulSoup(resp.text, "html.parser")
-    data = {}
-
-    for tag in soup.select(".tag-item"):
-        label = tag.find("span").get_text(strip=True)
-        val   = tag.find("bdi").get_text(strip=True)
-        if   label.startswith("Viti"):         data["year"]         = val
-        elif label.startswith("Transmetuesi"): data["transmission"] = val
-        elif label.startswith("Kilometrazha"): data["mileage"]      = val
-        elif label.startswith("Karburanti"):   data["fuel"]         = val
-        elif label.startswith("Komuna"):       data["municipality"] = val
-        elif label.startswith("Ngjyra"):       data["color"]        = val
-        elif label.startswith("Prodhuesi"):    data["make"]         = val
-        elif label.startswith("Modeli"):       data["model"]        = val
-
-    pe = soup.select_one(".new-price .format-money-int")
-    data["price_value"]    = pe["value"] if pe else ""
-    ce = soup.select_one(".new-price span:not(.format-money-int)")
-    data["price_currency"] = ce.get_text(strip=True) if ce else ""
+def parse_listing_html(content):
+    """Extract the listing fields from a detail page's raw HTML.
+
+    Runs in a worker process, so it takes and returns plain picklable data.
+    """
+    tree  = LexborHTMLParser(content)
+    first = tree.css_first
+    # Every column present up front: no dict growth, no DictWriter restval path
+    data  = dict.fromkeys(DETAIL_FIELDS, "")
+
+    for tag in tree.css(".tag-item"):
+        label = tag.css_first("span").text(strip=True)
+        val   = tag.css_first("bdi").text(strip=True)
+        key   = LABEL_MAP.get(label.split(" ", 1)[0].rstrip(":"))
+        if key:
+            data[key] = val
+
+    pe = first(".new-price .format-money-int")
+    data["price_value"]    = pe.attributes["value"] if pe else ""
+    ce = first(".new-price span:not(.format-money-int)")
+    data["price_currency"] = ce.text(strip=True) if ce else ""
+    return data
+
+async def parse_detail(client, throttle, cache, pool, url):
+    """Fetch and parse a single listing’s details.
 
+    Sends the validators from the last run; on 304 Not Modified the
+    previously parsed fields are reused without downloading the page.
+    Rows parsed by another PARSER_VERSION are ignored, so the page is
+    fetched and parsed again.
+    Parsing happens on `pool` so the event loop keeps downloading.
+    """
+    cached = cache.execute(
+        "SELECT etag, last_modified, data FROM listings WHERE url = ? AND parser = ?",
+        (url, PARSER_VERSION),
+    ).fetchone()
+    headers = {}
+    if cached:
+        if cached[0]: headers["If-None-Match"]     = cached[0]
+        if cached[1]: headers["If-Modified-Since"] = cached[1]
+
+    resp = await get_with_retries(client, throttle, url, headers=headers)
+    if resp.status_code == 304:
+        return url, json.loads(cached[2])
+
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(pool, parse_listing_html, resp.content)
+
+    etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+    if etag or last_modified:
+        cache.execute(
+            "INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)",
+            (url, etag, last_modified, json.dumps(data), PARSER_VERSION),
+        )
     return url, data
 
-def scrape_page(session, page_num, total_bar):
-    """Scrape listings on a single page in parallel."""
+async def scrape_page(client, throttle, cache, pool, seen, page_num, total_bar):
+    """Scrape listings on a single page concurrently.
+
+    Listings in `seen` (already queued by another page of this run as the
+    index shifts) are skipped without a request.
+    """
     page_url = f"{BASE_URL}{LISTING_PATH}?Page={page_num}"
-    resp     = get_with_retries(session, page_url)
-    soup     = BeautifulSoup(resp.text, "html.parser")
-    hrefs    = [a["href"] for a in soup.select("a.Link_vis")]
+    resp     = await get_with_retries(client, throttle, page_url)
+    urls     = []
+    for tag in LINK_TAG_RE.findall(resp.content):
+        if m := HREF_RE.search(tag):
+            href = html.unescape(m[m.lastindex].decode())
+            url  = href if href.startswith("http") else BASE_URL + href
+            if url not in seen:
+                seen.add(url)
+                urls.append(url)
 
+    outcomes = await asyncio.gather(
+        *(parse_detail(client, throttle, cache, pool, url) for url in urls),
+        return_exceptions=True,
+    )
     results = []
-    with ThreadPoolExecutor(max_workers=MAX_DETAIL_WORKERS) as executor:
-        futures = {executor.submit(parse_detail, session, href): href for href in hrefs}
-        for fut in tqdm(as_completed(futures),
-                        total=len(futures),
-                        desc=f"Page {page_num}",
-                        unit="lst",
-                        leave=False):
-            try:
-                url, details = fut.result()
-                total_bar.update(1)
-                results.append((url, details))
-            except Exception as e:
-                tqdm.write(f"[Page {page_num}] detail error for {futures[fut]} → {e}")
+    for url, outcome in zip(urls, outcomes):
+        if isinstance(outcome, Exception):
+            log.error("[Page %d] detail error for %s → %s", page_num, url, outcome)
+            continue
+        total_bar.update(1)
+        results.append(outcome)
     return results
 
+async def write_rows(queue, writer, scrape_ts):
+    """Single consumer: the only task that touches the CSV file."""
+    while (rows := await queue.get()) is not None:
+        writer.writerows({
+            "scrape_date": scrape_ts,
+            "listing_url": url,
+            **details
+        } for url, details in rows)
+
+async def scrape_all(writer, cache):
+    estimated_total = PAGES * 50
+    total_bar = tqdm(total=estimated_total, desc="Total Listings", unit="lst")
+
+    # One timestamp for the whole run; UTC, written without an offset
+    # because history rows are naive UTC and the dashboard reads them as such
+    scrape_ts = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    # Pages are written as they finish; a bounded queue keeps memory flat
+    queue     = asyncio.Queue(maxsize=WRITE_QUEUE)
+    consumer  = asyncio.create_task(write_rows(queue, writer, scrape_ts))
+    seen      = set()   # per run: today_listings.csv is rewritten every run
+
+    throttle = Throttle(MAX_CONCURRENCY, MAX_RATE)
+    limits   = httpx.Limits(max_connections=MAX_CONCURRENCY,
+                            max_keepalive_connections=MAX_CONCURRENCY)
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as pool:
+        async with httpx.AsyncClient(http2=True, headers=HEADERS,
+                                     limits=limits, timeout=10) as client:
+
+            async def produce(pg):
+                try:
+                    await queue.put(await scrape_page(client, throttle, cache, pool, seen,
+                                                       pg, total_bar))
+                except Exception as e:
+                    log.error("[Page %d] failed after retries → %s", pg, e)
+
+            async def produce_all():
+                await asyncio.gather(*(produce(pg) for pg in range(1, PAGES + 1)))
+                await queue.put(None)
+
+            # Await the writer alongside the producers: if it fails, the error
+            # surfaces here instead of producers blocking on a full queue
+            producers = asyncio.create_task(produce_all())
+            try:
+                await asyncio.gather(consumer, producers)
+            except BaseException:
+                producers.cancel()
+                raise
+
+    total_bar.close()
+
+def setup_logging():
+    """Buffer log records in memory and write them to SCRAPE_LOG in batches,
+    keeping terminal output to the progress bar."""
+    target  = logging.FileHandler(SCRAPE_LOG, mode="w", encoding="utf-8")
+    target.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    handler = MemoryHandler(capacity=256, flushLevel=logging.CRITICAL, target=target)
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    return handler
+
 def main():
     os.makedirs(os.path.dirname(OUTPUT_FILE) or ".", exist_ok=True)
-    with open(OUTPUT_FILE, "w", newline="", encoding="utf-8") as f:
+    handler = setup_logging()
+    with open(OUTPUT_FILE, "w", newline="", encoding="utf-8",
+              buffering=WRITE_BUFFER) as f:
         writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
         writer.writeheader()
-
-        estimated_total = PAGES * 50
-        total_bar = tqdm(total=estimated_total, desc="Total Listings", unit="lst")
-
-        for i in range(0, PAGES, CHUNK_SIZE):
-            chunk = list(range(i+1, min(PAGES, i+CHUNK_SIZE)+1))
-            session = requests.Session()
-            session.headers.update(HEADERS)
-
-            with ThreadPoolExecutor(max_workers=len(chunk)) as page_exec:
-                futures = {page_exec.submit(scrape_page, session, pg, total_bar): pg for pg in chunk}
-                for fut in as_completed(futures):
-                    pg = futures[fut]
-                    try:
-                        for url, details in fut.result():
-                            writer.writerow({
-                                "scrape_date": datetime.utcnow().isoformat(),
-                                "listing_url": url,
-                                **details
-                            })
-                    except Exception as e:
-                        tqdm.write(f"[Page {pg}] failed after retries → {e}")
-            session.close()
-
-        total_bar.close()
+        cache = open_cache()
+        try:
+            asyncio.run(scrape_all(writer, cache))
+        finally:
+            # keep what was fetched even if the run fails part-way
+            cache.commit()
+            cache.close()
+            # MemoryHandler.close() only drops its target; flush the buffer
+            # into the FileHandler first, then close that so scrape.log is
+            # complete before the workflow prints it
+            handler.flush()
+            handler.target.close()
+            handler.close()
     print(f"✅ Done — wrote {OUTPUT_FILE}")
 
 if __name__ == "__main__":